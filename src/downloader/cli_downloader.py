@@ -1,5 +1,6 @@
 from .downloader_funcs import (
     fetch_json_data,
+    build_index,
     get_classes,
     get_subjects,
     get_books,
@@ -9,27 +10,41 @@ import os
 from config.config import json_path, processing_path, output_path
 
 
+def _clear():
+    """
+    Clears the terminal screen using ANSI escape codes instead of spawning a shell.
+    """
+    print("\x1b[2J\x1b[H", end="", flush=True)
+
+
 def run_cli_downloader():
     """
     This function runs the cli downloader, it will keep running until user chooses to stop downloading books.
-    It will first fetch the json data from the given json file path.
+    It will first fetch the json data from the given json file path and build the books index from it.
     Then it will enter a loop where user will be asked to select a class, then a subject from the selected class, then a book from the selected subject.
     After selecting a book, the function will download the book and print the page link, book code and the name of the merged pdf file.
     Finally it will ask user if they want to download again, if user types 'n' then it will break the loop and stop the program, if user types 'y' then it will clear the screen and start the loop again.
     The function will also clear the screen before asking for user input every time.
     """
 
-    json_data = fetch_json_data(json_path)
+    if os.name == "nt":
+        os.system("")  # enables ANSI escape codes in the Windows console
+
+    # The working and output folders stay the same for every download
+    os.makedirs(processing_path, exist_ok=True)
+    os.makedirs(output_path, exist_ok=True)
+
+    book_index = build_index(fetch_json_data(json_path))
 
     while True:
         print("Select Class from the following list:-")
-        classes = get_classes(json_data)
+        classes = get_classes(book_index)
         print(classes)
         print()
         print()
         class_number = int(input("Type class number\n"))
         print("Select Subject from the following list:-\n")
-        subject_list = get_subjects(json_data, class_number)
+        subject_list = get_subjects(book_index, class_number)
         for id, value in enumerate(subject_list):
             print(f"{id+1}-{value}")
         # print(subject_list)
@@ -38,14 +53,14 @@ def run_cli_downloader():
         subject_name = subject_list[subject_id]
         print()
         print("Select Book from the following list:-\n")
-        book_list = get_books(json_data, class_number, subject_name)
+        book_list = get_books(book_index, class_number, subject_name)
         for id, value in enumerate(book_list):
             print(f"{id+1}-{value}")
         # print(book_list)
         book_id = int(input("Type Index of Book you want to select\n")) - 1
         book_name = book_list[book_id]
         download_link, page_link, book_code, merged_file_name = run_funcs_cli(
-            json_data,
+            book_index,
             class_number,
             subject_name,
             book_name,
@@ -59,7 +74,7 @@ def run_cli_downloader():
         if re_flag == "n":
             break
         else:
-            os.system("cls")
+            _clear()
             continue
 
 
@@ -1,107 +1,155 @@
+import contextlib
+import errno
 import os
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import zipfile
 from PIL import Image
 from pypdf import PdfWriter
 import re
 import shutil
+import tempfile
 import json
+import pickle
+
+try:
+    import pikepdf
+except ImportError:  # fall back to the pure Python pypdf merger
+    pikepdf = None
+
+# Shared session so repeated downloads reuse pooled keep-alive connections
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(
+    pool_connections=4,
+    pool_maxsize=8,
+    max_retries=Retry(total=3, backoff_factor=0.3),
+)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.mount("http://", _ADAPTER)
+
+# Pillow keeps every page of a save decoded until it finishes, so image runs are
+# written in batches of at most this many pages to bound memory use
+_PAGES_PER_BATCH = 16
+
+_NUM_ALPHA = re.compile(r"(\d+)([a-zA-Z]*)")
 
 
 def fetch_json_data(jpath):
     """
     Fetches JSON data from a given file path.
 
+    The parsed data is cached in a pickle file next to the JSON file, which is reused
+    on later runs as long as it is not older than the JSON file.
+
     Args:
         jpath (str): File path to the JSON data
 
     Returns:
         dict: JSON data
     """
-    with open(jpath, "r") as j:
+    cache_path = jpath + ".cache"
+    try:
+        if os.stat(cache_path).st_mtime >= os.stat(jpath).st_mtime:
+            with open(cache_path, "rb") as c:
+                return pickle.load(c)
+    except Exception:
+        # Missing, stale or unreadable cache (including one pickled by another
+        # Python version), fall back to parsing the JSON
+        pass
+
+    with open(jpath, "r", encoding="utf-8") as j:
         json_data = json.load(j)
+
+    try:
+        with open(cache_path, "wb") as c:
+            pickle.dump(json_data, c, protocol=pickle.HIGHEST_PROTOCOL)
+    except OSError:
+        pass
     return json_data
 
 
-def get_classes(data):
+def build_index(data):
     """
-    Returns a list of unique class numbers from the given JSON data.
+    Builds a nested lookup index from the given JSON data.
+
+    The index maps class number to subject name to book title to the book record,
+    so that class, subject, book and link lookups do not have to scan the JSON data.
 
     Args:
-        data (list): List of JSON objects
+        data (list): List of JSON objects representing the books data.
 
     Returns:
-        list: List of unique class numbers
+        dict: Nested dictionary of the form {class: {subject: {title: book}}}
     """
-    class_list = []
+    index = {}
     for item in data:
-        curr_class = item.get("class")
-        if curr_class not in class_list:
-            class_list.append(curr_class)
-        else:
-            pass
-    return class_list
+        index.setdefault(item["class"], {}).setdefault(item["subject"], {}).update(
+            {book["title"]: book for book in item["books"]}
+        )
+    return index
 
 
-def get_subjects(data, classno):
+def get_classes(index):
     """
-    Returns a list of unique subject names from the given JSON data for a given class number.
+    Returns a list of unique class numbers from the given books index.
 
     Args:
-        data (list): List of JSON objects
+        index (dict): Books index built by build_index
+
+    Returns:
+        list: List of unique class numbers
+    """
+    return list(index)
+
+
+def get_subjects(index, classno):
+    """
+    Returns a list of unique subject names from the given books index for a given class number.
+
+    Args:
+        index (dict): Books index built by build_index
         classno (int): Class number
 
     Returns:
         list: List of unique subject names
     """
-    subjects = []
-    for item in data:
-        if item.get("class") == classno:
-            subjects.append(item.get("subject"))
-    return subjects
+    return list(index.get(classno, {}))
 
 
-def get_books(data, classno, subname):
+def get_books(index, classno, subname):
     """
-    Returns a list of book titles for a given class number and subject name from the JSON data.
+    Returns a list of book titles for a given class number and subject name from the books index.
 
     Args:
-        data (list): List of JSON objects representing the books data.
+        index (dict): Books index built by build_index.
         classno (int): Class number to filter the books.
         subname (str): Subject name to filter the books.
 
     Returns:
         list: List of book titles that match the specified class number and subject name.
     """
-    book_list = []
-    for item in data:
-        if item.get("class") == classno and item.get("subject") == subname:
-            for books in item.get("books"):
-                book_list.append(books.get("title"))
-    return book_list
+    return list(index.get(classno, {}).get(subname, {}))
 
 
-def get_link(data, classno, subname, bookname):
+def get_link(index, classno, subname, bookname):
     """
     Returns the download link, page link and book code for a given class number, subject name and book title.
 
     Args:
-        data (list): List of JSON objects representing the books data.
+        index (dict): Books index built by build_index.
         classno (int): Class number to filter the books.
         subname (str): Subject name to filter the books.
         bookname (str): Book title to filter the books.
 
     Returns:
         tuple: Tuple containing the download link, page link and book code for the given book.
+
+    Raises:
+        KeyError: If no book matches the given class number, subject name and book title.
     """
-    for item in data:
-        if item.get("class") == classno and item.get("subject") == subname:
-            for books in item.get("books"):
-                if books.get("title") == bookname:
-                    download_link = books.get("dlink")
-                    page_link = books.get("link")
-                    book_code = books.get("code")
-    return download_link, page_link, book_code
+    book = index[classno][subname][bookname]
+    return book.get("dlink"), book.get("link"), book.get("code")
 
 
 def download_file(link, dpath):
@@ -113,30 +161,28 @@ def download_file(link, dpath):
         dpath (str): The directory path where the downloaded file will be saved.
 
     Returns:
-        str: The full file path where the downloaded file is saved if successful.
-        None: If the download fails.
+        str: The full file path where the downloaded file is saved.
+
+    Raises:
+        requests.HTTPError: If the server responds with an error status.
     """
     # Ensure the save path exists
-    if not os.path.exists(dpath):
-        os.makedirs(dpath)
+    os.makedirs(dpath, exist_ok=True)
 
     # Get the file name from the download link
     file_name = link.split("/")[-1]
     # Create the full path to save the file
     file_path = os.path.join(dpath, file_name)
-    # Download the file content
-    response = requests.get(link)
-
-    # Check if the request was successful
-    if response.status_code == 200:
+    # Stream the file content to disk in 1 MiB chunks
+    with _SESSION.get(link, stream=True, timeout=30) as response:
+        # Check if the request was successful
+        response.raise_for_status()
+        response.raw.decode_content = True
         # Write the content to the file
         with open(file_path, "wb") as file:
-            file.write(response.content)
-        # print(f"File downloaded successfully and saved to {file_path}")
-        return file_path
-    else:
-        print(f"Failed to download file. Status code: {response.status_code}")
-        return None
+            shutil.copyfileobj(response.raw, file, length=1024 * 1024)
+    # print(f"File downloaded successfully and saved to {file_path}")
+    return file_path
 
 
 def unzip_file(zip_path, extract_to):
@@ -150,6 +196,9 @@ def unzip_file(zip_path, extract_to):
     Returns:
         str: The full path where the unzipped content is saved if successful.
         None: If the unzipping fails.
+
+    Raises:
+        ValueError: If a member of the zip file would be extracted outside the extraction folder.
     """
     # Extract the file name without extension to create the extraction folder name
     file_name = os.path.basename(zip_path)
@@ -157,54 +206,180 @@ def unzip_file(zip_path, extract_to):
     extraction_path = os.path.join(extract_to, folder_name)
 
     # Ensure the extraction path exists
-    if not os.path.exists(extraction_path):
-        os.makedirs(extraction_path)
+    os.makedirs(extraction_path, exist_ok=True)
 
-    # Unzip the file
+    # Unzip the file member by member with a 1 MiB copy buffer
+    extraction_root = os.path.abspath(extraction_path)
     with zipfile.ZipFile(zip_path, "r") as zip_ref:
-        zip_ref.extractall(extraction_path)
+        for info in zip_ref.infolist():
+            if info.is_dir():
+                continue
+            target = os.path.abspath(os.path.join(extraction_root, info.filename))
+            # Refuse members that would be written outside the extraction folder
+            if os.path.commonpath([extraction_root, target]) != extraction_root:
+                raise ValueError(f"Unsafe path in zip file: {info.filename}")
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            with zip_ref.open(info) as src, open(target, "wb") as dst:
+                shutil.copyfileobj(src, dst, length=1024 * 1024)
     # print(f"File unzipped successfully and saved to {extraction_path}")
     return extraction_path
 
 
-def convert_images_to_pdfs(directory):
+def write_images_to_pdf(image_paths, output_path):
     """
-    Converts all images in a given directory to PDFs and saves them in the same directory.
+    Writes the given images, in order, into a single multi-page PDF file.
+
+    The images are written in one pass by Pillow's PDF writer, without creating a
+    PDF per image. Images which are not RGB or grayscale (e.g. palette or RGBA PNGs)
+    are converted to RGB first, so every page is stored as a JPEG stream.
+
+    Every page stays decoded in memory until the whole file is written, so callers
+    should pass a bounded number of images.
 
     Args:
-        directory (str): The directory path where the images are located.
+        image_paths (list): The paths of the images, in page order.
+        output_path (str): The file path where the PDF will be saved.
 
     Returns:
         None
-    """
-    for file_name in os.listdir(directory):
-        if file_name.endswith((".jpg", ".png", ".jpeg")):
-            image_path = os.path.join(directory, file_name)
-            image = Image.open(image_path)
-            pdf_path = os.path.join(directory, os.path.splitext(file_name)[0] + ".pdf")
-            image.save(pdf_path, "PDF", resolution=100.0)
-            print(f"Converted {image_path} to {pdf_path}")
 
+    Raises:
+        ValueError: If no image paths are given.
+    """
+    if not image_paths:
+        raise ValueError("No images to write to the PDF")
 
-def merge_pdfs(directory, output_path):
+    with contextlib.ExitStack() as stack:
+        images = []
+        for image_path in image_paths:
+            image = Image.open(image_path)
+            if image.mode not in ("RGB", "L"):
+                # Close the source as soon as its RGB copy exists
+                with image:
+                    image = image.convert("RGB")
+            images.append(stack.enter_context(image))
+
+        # Same mode Pillow opens output paths with, but with a 1 MiB write buffer
+        with open(output_path, "w+b", buffering=1024 * 1024) as output_file:
+            append_images = images[1:]
+            try:
+                images[0].save(
+                    output_file,
+                    "PDF",
+                    save_all=True,
+                    append_images=append_images,
+                    resolution=100.0,
+                )
+            except BaseException:
+                # Like Image.save with a path, don't leave a partial file behind
+                output_file.close()
+                os.remove(output_path)
+                raise
+            finally:
+                # Pillow stores this list in the encoder info of every page it writes,
+                # clearing it breaks that reference cycle so the pages can be freed
+                append_images.clear()
+
+
+def merge_pdfs(pdf_paths, output_path):
     """
-    Merges all PDF files in a given directory into a single PDF file.
+    Merges the given PDF files, in order, into a single PDF file.
+
+    If pikepdf is installed, its C++ backed page copying is used, which does not
+    re-serialize the page streams. Otherwise the files are merged with pypdf.
 
     Args:
-        directory (str): The directory path where the PDF files are located.
+        pdf_paths (list): The paths of the PDF files, in page order.
         output_path (str): The file path where the merged PDF will be saved.
 
     Returns:
         None
     """
-    pdf_files = [f for f in os.listdir(directory) if f.endswith(".pdf")]
-    sorted_files = sorted(pdf_files, key=extract_numeric_alpha)
-    print(sorted_files)
+    if pikepdf:
+        # The sources must stay open until saving, as pages are copied lazily
+        with contextlib.ExitStack() as stack:
+            merged = stack.enter_context(pikepdf.Pdf.new())
+            for pdf_path in pdf_paths:
+                source = stack.enter_context(pikepdf.Pdf.open(pdf_path))
+                merged.pages.extend(source.pages)
+            merged.save(output_path)
+        return
+
     merger = PdfWriter()
-    for pdf in sorted_files:
-        merger.append(os.path.join(directory, pdf))
+    for pdf_path in pdf_paths:
+        merger.append(pdf_path)
     merger.write(output_path)
     merger.close()
+
+
+def merge_pdfs_from_images(directory, output_path):
+    """
+    Merges all images and PDF files in a given directory into a single PDF file.
+
+    The files are sorted by their numerical and alphabetic parts. Consecutive images
+    are grouped into batches of at most _PAGES_PER_BATCH pages. If the directory only
+    holds a single batch of images, it is written straight into the output by
+    write_images_to_pdf. Otherwise each batch is first written to its own PDF, and
+    those are merged with the directory's PDF files by merge_pdfs, so that only one
+    batch of decoded pages is held in memory at a time.
+
+    Args:
+        directory (str): The directory path where the images and PDF files are located.
+        output_path (str): The file path where the merged PDF will be saved.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: If the directory holds no images or PDF files.
+    """
+    with os.scandir(directory) as entries:
+        page_entries = [
+            entry
+            for entry in entries
+            if entry.name.lower().endswith((".jpg", ".jpeg", ".png", ".pdf"))
+        ]
+    if not page_entries:
+        raise ValueError(f"No images or PDF files found in {directory}")
+    page_entries.sort(key=lambda entry: extract_numeric_alpha(entry.name))
+    print([entry.name for entry in page_entries])
+
+    # Group consecutive images into bounded batches, PDF files stand on their own
+    parts = []
+    for entry in page_entries:
+        if entry.name.lower().endswith(".pdf"):
+            parts.append(entry.path)
+        elif (
+            parts
+            and isinstance(parts[-1], list)
+            and len(parts[-1]) < _PAGES_PER_BATCH
+        ):
+            parts[-1].append(entry.path)
+        else:
+            parts.append([entry.path])
+
+    if len(parts) == 1 and isinstance(parts[0], list):
+        write_images_to_pdf(parts[0], output_path)
+        return
+
+    images_pdfs = []
+    try:
+        pdf_paths = []
+        for part in parts:
+            if isinstance(part, list):
+                fd, images_pdf = tempfile.mkstemp(suffix=".pdf", dir=directory)
+                os.close(fd)
+                images_pdfs.append(images_pdf)
+                write_images_to_pdf(part, images_pdf)
+                pdf_paths.append(images_pdf)
+            else:
+                pdf_paths.append(part)
+        merge_pdfs(pdf_paths, output_path)
+    finally:
+        for images_pdf in images_pdfs:
+            # write_images_to_pdf already removes its output if writing it failed
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(images_pdf)
     # print(f"PDFs merged into {output_path}")
 
 
@@ -214,56 +389,48 @@ def extract_numeric_alpha(filename):
 
     If the filename matches the regular expression (\d+)([a-zA-Z]*), it returns a tuple
     with the numeric part and the alphabetic part. If the filename does not match, it
-    returns the filename as is.
+    returns a tuple of infinity and the filename, so that such files sort after all
+    numbered files instead of failing to compare with them.
 
     The numeric part is converted to an integer.
 
-    This function is used to sort PDF files by their numerical and alphabetic parts.
+    This function is used to sort image and PDF files by their numerical and alphabetic parts.
     """
-    match = re.search(r"(\d+)([a-zA-Z]*)", filename)
+    match = _NUM_ALPHA.search(filename)
     if match:
-        num_part = int(match.group(1))
-        alpha_part = match.group(2)
-        return (num_part, alpha_part)
-    return filename
+        return (int(match.group(1)), match.group(2))
+    return (float("inf"), filename)
 
 
-def clean_up_directory(directory, keep_file):
+def move_into_place(source_path, destination_path):
     """
-    Clean up a directory by deleting all files and subdirectories except for a given file.
+    Moves a finished file to its destination without ever exposing a partial file there.
 
-    Args:
-        directory (str): The directory path to clean up.
-        keep_file (str): The file path that should not be deleted.
-
-    Returns:
-        None
-    """
-    for item in os.listdir(directory):
-        item_path = os.path.join(directory, item)
-        if item_path != keep_file and item!='.gitkeep':
-            if os.path.isdir(item_path):
-                shutil.rmtree(item_path)
-            else:
-                os.remove(item_path)
-    # print(f"Cleaned up directory, keeping only {keep_file}")
-
-
-def move_file(source_path, destination_folder):
-    """
-    Moves a file from a source path to a destination folder.
+    On the same filesystem this is a single atomic rename. Across filesystems the file
+    is first copied next to the destination under a ".part" name and then renamed,
+    and the partial copy is removed if copying fails.
 
     Args:
         source_path (str): The path of the file to move.
-        destination_folder (str): The directory path where the file should be moved.
+        destination_path (str): The full path the file should end up at.
 
     Returns:
         None
     """
-    if not os.path.exists(destination_folder):
-        os.makedirs(destination_folder)
-    shutil.move(source_path, destination_folder)
-    # print(f"Moved {source_path} to {destination_folder}")
+    try:
+        os.replace(source_path, destination_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        partial_path = destination_path + ".part"
+        try:
+            shutil.copyfile(source_path, partial_path)
+            os.replace(partial_path, destination_path)
+        except BaseException:
+            if os.path.exists(partial_path):
+                os.remove(partial_path)
+            raise
+        os.remove(source_path)
 
 
 def file_name_gen(spath, classno, subname, bkname):
@@ -290,40 +457,41 @@ def file_name_gen(spath, classno, subname, bkname):
 
 
 def run_funcs_cli(
-    json_data, class_number, subject_name, book_name, processing_path, opt_path
+    book_index, class_number, subject_name, book_name, processing_path, opt_path
 ):
     """
     Runs the CLI downloader functions in sequence.
 
     Args:
-        json_data (dict): The JSON data containing the links to the books.
+        book_index (dict): The books index, built by build_index, containing the links to the books.
         class_number (int): The class number to download.
         subject_name (str): The subject name to download.
         book_name (str): The book name to download.
-        processing_path (str): The directory path where the downloaded file will be saved.
-        opt_path (str): The directory path where the merged PDF file will be saved.
+        processing_path (str): The existing directory path under which a temporary working folder is created for the download.
+        opt_path (str): The existing directory path where the merged PDF file will be saved.
 
     Returns:
         tuple: A tuple containing the download link, page link, book code, and the generated PDF file name.
     """
 
     download_link, page_link, book_code = get_link(
-        json_data, class_number, subject_name, book_name
-    )
-    opt_file = download_file(download_link, processing_path)
-    unzip_path = unzip_file(opt_file, processing_path)
-    convert_images_to_pdfs(unzip_path)
-    merged_file_name, output_pdf_path = file_name_gen(
-        processing_path, class_number, subject_name, book_name
+        book_index, class_number, subject_name, book_name
     )
-    merge_pdfs(unzip_path, output_pdf_path)
-    clean_up_directory(processing_path, output_pdf_path)
-    move_file(output_pdf_path, opt_path)
+    # Work in a scratch folder which is removed as a whole once the book is moved out
+    with tempfile.TemporaryDirectory(dir=processing_path) as work_path:
+        opt_file = download_file(download_link, work_path)
+        unzip_path = unzip_file(opt_file, work_path)
+        merged_file_name, output_pdf_path = file_name_gen(
+            work_path, class_number, subject_name, book_name
+        )
+        merge_pdfs_from_images(unzip_path, output_pdf_path)
+        # Only a complete book ever appears in the output folder
+        move_into_place(output_pdf_path, os.path.join(opt_path, merged_file_name))
     return download_link, page_link, book_code, merged_file_name
 
 
 def run_funcs_gui(
-    json_data,
+    book_index,
     class_number,
     subject_name,
     book_name,
@@ -335,18 +503,18 @@ def run_funcs_gui(
     Runs the GUI downloader functions in sequence.
 
     Args:
-        json_data (dict): The JSON data containing the links to the books.
+        book_index (dict): The books index, built by build_index, containing the links to the books.
         class_number (int): The class number to download.
         subject_name (str): The subject name to download.
         book_name (str): The book name to download.
-        processing_path (str): The directory path where the downloaded file will be saved.
-        opt_path (str): The directory path where the merged PDF file will be saved.
+        processing_path (str): The existing directory path under which a temporary working folder is created for the download.
+        opt_path (str): The existing directory path where the merged PDF file will be saved.
         progress_callback (function): An optional callback function to update the progress of the download process.
 
     Returns:
         tuple: A tuple containing the download link, page link, book code, and the generated PDF file name.
     """
-    steps = 8
+    steps = 6
     current_step = 0
 
     def update_progress():
@@ -356,31 +524,28 @@ def run_funcs_gui(
             progress_callback(current_step / steps)
 
     download_link, page_link, book_code = get_link(
-        json_data, class_number, subject_name, book_name
+        book_index, class_number, subject_name, book_name
     )
     update_progress()
 
-    opt_file = download_file(download_link, processing_path)
-    update_progress()
+    # Work in a scratch folder which is removed as a whole once the book is moved out
+    with tempfile.TemporaryDirectory(dir=processing_path) as work_path:
+        opt_file = download_file(download_link, work_path)
+        update_progress()
 
-    unzip_path = unzip_file(opt_file, processing_path)
-    update_progress()
+        unzip_path = unzip_file(opt_file, work_path)
+        update_progress()
 
-    convert_images_to_pdfs(unzip_path)
-    update_progress()
-
-    merged_file_name, output_pdf_path = file_name_gen(
-        processing_path, class_number, subject_name, book_name
-    )
-    update_progress()
+        merged_file_name, output_pdf_path = file_name_gen(
+            work_path, class_number, subject_name, book_name
+        )
+        update_progress()
 
-    merge_pdfs(unzip_path, output_pdf_path)
-    update_progress()
-
-    clean_up_directory(processing_path, output_pdf_path)
-    update_progress()
+        merge_pdfs_from_images(unzip_path, output_pdf_path)
+        update_progress()
 
-    move_file(output_pdf_path, opt_path)
-    update_progress()
+        # Only a complete book ever appears in the output folder
+        move_into_place(output_pdf_path, os.path.join(opt_path, merged_file_name))
+        update_progress()
 
     return download_link, page_link, book_code, merged_file_name
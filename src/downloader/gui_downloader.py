@@ -1,6 +1,10 @@
+import os
+import threading
+import time
 import customtkinter as ctk
 from .downloader_funcs import (
     fetch_json_data,
+    build_index,
     get_classes,
     get_subjects,
     get_books,
@@ -18,55 +22,108 @@ def run_gui_downloader():
     download link, and generated PDF file name.
 
     The function performs the following steps:
-    - Fetches JSON data containing book information from a specified path.
+    - Fetches JSON data containing book information from a specified path and indexes it.
     - Sets up a GUI using the customtkinter library.
     - Provides dropdowns for class, subject, and book selection.
     - Updates available subjects and books based on class and subject selections.
-    - Initiates a download process and updates the progress bar.
+    - Initiates a download process in a background thread and updates the progress bar.
     - Displays the result of the download including links and file information.
     - Allows repeated operations through GUI interactions.
 
     Note: This function runs an infinite main loop to keep the GUI active.
     """
-    json_data = fetch_json_data(json_path)
+    # The working and output folders stay the same for every download
+    os.makedirs(processing_path, exist_ok=True)
+    os.makedirs(output_path, exist_ok=True)
+
+    book_index = build_index(fetch_json_data(json_path))
+
+    # Pending Tk "after" job ids and last applied selections of the debounced updates
+    pending_updates = {"subjects": None, "books": None}
+    last_selection = {"subjects": None, "books": None}
+
+    def schedule_update(key, callback):
+        """
+        Schedules a debounced update, cancelling any update of the same kind still pending.
+
+        Several writes to a selection variable in quick succession (e.g. typing into
+        a combobox, or the reset done by update_subjects) are coalesced into a single
+        update which runs 50 ms after the last write.
+
+        Args:
+            key (str): The kind of update, either "subjects" or "books".
+            callback (function): The function performing the update.
+        """
+        if pending_updates[key]:
+            app.after_cancel(pending_updates[key])
+        pending_updates[key] = app.after(50, callback)
 
     def update_subjects(*args):
         """
-        Updates the list of available subjects based on the selected class.
+        Schedules an update of the available subjects based on the selected class.
 
-        This function is triggered whenever the class selection changes. It
-        fetches the list of subjects for the selected class, updates the
-        subject dropdown with the new list, and resets the subject selection
-        to the first available subject.
+        This function is triggered whenever the class selection changes.
 
         Args:
             *args: Ignored. The function takes arbitrary arguments to conform
                 to the expected signature for a Tkinter callback function.
         """
-        class_number = int(class_selected.get())
-        subjects = get_subjects(json_data, class_number)
-        subject_combo.configure(values=[s for s in subjects])
-        subject_selected.set("")  # reset subject selection
+        schedule_update("subjects", refresh_subjects)
 
     def update_books(*args):
         """
-        Updates the list of available books based on the selected class and subject.
+        Schedules an update of the available books based on the selected class and subject.
 
-        This function is triggered whenever the class or subject selection changes. It
-        fetches the list of books for the selected class and subject, updates the
-        book dropdown with the new list, and resets the book selection to the first
-        available book.
+        This function is triggered whenever the subject selection changes.
 
         Args:
             *args: Ignored. The function takes arbitrary arguments to conform
                 to the expected signature for a Tkinter callback function.
         """
-        class_number = int(class_selected.get())
-        subject_name = subject_selected.get()
-        books = get_books(json_data, class_number, subject_name)
-        book_combo.configure(values=[b for b in books])
+        schedule_update("books", refresh_books)
+
+    def refresh_subjects():
+        """
+        Updates the list of available subjects based on the selected class.
+
+        It fetches the list of subjects for the selected class, updates the
+        subject dropdown with the new list, and resets the subject selection.
+        Nothing is done if the selected class has not changed since the last update.
+        """
+        pending_updates["subjects"] = None
+        selection = class_selected.get()
+        if selection == last_selection["subjects"]:
+            return
+        last_selection["subjects"] = selection
+
+        class_number = int(selection)
+        subjects = get_subjects(book_index, class_number)
+        subject_combo.configure(values=subjects)
+        subject_selected.set("")  # reset subject selection
+
+    def refresh_books():
+        """
+        Updates the list of available books based on the selected class and subject.
+
+        It fetches the list of books for the selected class and subject, updates the
+        book dropdown with the new list, and resets the book selection.
+        Nothing is done if the selected class and subject have not changed since the
+        last update.
+        """
+        pending_updates["books"] = None
+        selection = (class_selected.get(), subject_selected.get())
+        if selection == last_selection["books"]:
+            return
+        last_selection["books"] = selection
+
+        class_number = int(selection[0])
+        subject_name = selection[1]
+        books = get_books(book_index, class_number, subject_name)
+        book_combo.configure(values=books)
         book_selected.set("")  # reset book selection
 
+    last_draw = [0.0]  # time of the last progress redraw
+
     def progress_callback(progress):
         """
         Updates the progress bar with the current progress.
@@ -75,12 +132,18 @@ def run_gui_downloader():
         during the download process. It also refreshes the UI to reflect the
         current progress.
 
+        The UI is redrawn at most every 100 ms, and always once the progress
+        reaches completion.
+
         Args:
             progress (float): The current progress as a float between 0 and 1,
                             representing the completion percentage.
         """
         progress_bar.set(progress)
-        app.update_idletasks()  # Update the UI
+        now = time.monotonic()
+        if progress >= 1.0 or now - last_draw[0] > 0.1:
+            last_draw[0] = now
+            app.update_idletasks()  # Update the UI
 
     def start_download():
         """
@@ -89,9 +152,8 @@ def run_gui_downloader():
         This function is triggered when the user clicks the "Download" button.
         It fetches the selected book's information (class number, subject name,
         book name), validates the inputs, and then initiates the download process
-        using the run_funcs_gui function. The function updates the progress bar
-        and displays the results (book code, page link, download link, and PDF
-        file name) in the respective text boxes after the download is complete.
+        in a background thread (see run_download), so that the window stays
+        responsive. The download button is disabled until the download finishes.
 
         If the inputs are invalid (e.g., no class, subject, or book is selected),
         the function does nothing.
@@ -110,18 +172,55 @@ def run_gui_downloader():
             )  # Show the progress bar
             progress_bar.set(0)  # Reset progress bar to 0
 
-            # Perform the download process
-            download_link, page_link, book_code, pdf_file_name = run_funcs_gui(
-                json_data,
+            threading.Thread(
+                target=run_download,
+                args=(class_number, subject_name, book_name),
+                daemon=True,
+            ).start()
+
+    def run_download(class_number, subject_name, book_name):
+        """
+        Runs the download process for the given book in a background thread.
+
+        Tkinter widgets must only be touched from the main thread, so progress
+        updates and the final results are handed back to it with app.after.
+
+        Args:
+            class_number (int): The class number of the book.
+            subject_name (str): The subject name of the book.
+            book_name (str): The book name.
+        """
+        result = None
+        try:
+            result = run_funcs_gui(
+                book_index,
                 class_number,
                 subject_name,
                 book_name,
                 processing_path,
                 output_path,
-                progress_callback,
+                lambda progress: app.after(0, progress_callback, progress),
             )
-            # Hide the progress bar after completion
-            progress_bar.grid_forget()
+        finally:
+            app.after(0, finish_download, result)
+
+    def finish_download(result):
+        """
+        Displays the results of a finished download and re-enables the download button.
+
+        The results (book code, page link, download link, and PDF file name) are
+        shown in the respective text boxes. If the download failed, the previous
+        results are left untouched.
+
+        Args:
+            result (tuple): The tuple returned by run_funcs_gui, or None if the
+                download failed.
+        """
+        # Hide the progress bar after completion
+        progress_bar.grid_forget()
+
+        if result:
+            download_link, page_link, book_code, pdf_file_name = result
             # Display the results
             book_code_box.configure(state="normal")
             book_code_box.delete(1.0, ctk.END)  # clear previous text
@@ -143,7 +242,7 @@ def run_gui_downloader():
             pdf_file_name_box.insert(ctk.END, pdf_file_name)
             pdf_file_name_box.configure(state="disabled")  # make the text box read-only
 
-            download_button.configure(text="Download", state="normal")
+        download_button.configure(text="Download", state="normal")
 
     app = ctk.CTk()
     app.title("NCERT Books Downloader")
@@ -154,7 +253,7 @@ def run_gui_downloader():
 
     class_label = ctk.CTkLabel(app, text="Select Class")
     class_label.grid(row=0, column=0, padx=10, pady=(20, 10), sticky="ew")
-    classes = get_classes(json_data)
+    classes = get_classes(book_index)
     class_selected = ctk.StringVar(value=0)
     class_combo = ctk.CTkComboBox(
         app, values=[str(c) for c in classes], variable=class_selected, width=10
@@ -1,3 +1,4 @@
 from downloader import run_cli_downloader
 
-run_cli_downloader()
+if __name__ == "__main__":
+    run_cli_downloader()
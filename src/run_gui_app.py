@@ -1,3 +1,4 @@
 from downloader import run_gui_downloader
 
-run_gui_downloader()
+if __name__ == "__main__":
+    run_gui_downloader()